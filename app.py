@@ -1,33 +1,448 @@
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, Response, render_template, request, jsonify, send_file, stream_with_context
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
-import json
+from flask_compress import Compress
 import os
+import atexit
+import contextlib
+import bisect
+import functools
+import hashlib
+import heapq
+import threading
+import time
 import csv
 import io
+import itertools
+import operator
 from datetime import datetime, timedelta
 from collections import defaultdict
-import uuid
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: no flock, so only run a single process there
+    fcntl = None
+
+# Prefer orjson, then ujson; both are much faster than stdlib json
+try:
+    import orjson
+
+    JSONDecodeError = orjson.JSONDecodeError
+
+    def json_dumps(obj, pretty=False):
+        """Serialize obj to JSON bytes, indented only when asked"""
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if pretty else None)
+
+    json_loads = orjson.loads
+except ImportError:
+    import ujson
+
+    JSONDecodeError = ValueError
+
+    def json_dumps(obj, pretty=False):
+        """Serialize obj to JSON bytes, indented only when asked"""
+        return ujson.dumps(obj, indent=2 if pretty else 0, ensure_ascii=False,
+                           escape_forward_slashes=False).encode()
+
+    json_loads = ujson.loads
+
+class FastJSONProvider(JSONProvider):
+    """Serve jsonify/request.json through json_dumps/json_loads instead of stdlib json"""
+
+    def dumps(self, obj, **kwargs):
+        return json_dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return json_loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(json_dumps(obj), mimetype='application/json')
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 CORS(app)
+# JSON responses repeat the same keys on every record and compress very well
+app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+Compress(app)
 
 # Data storage (in production, use a database)
 DATA_FILE = 'data/business_data.json'
+# Writes are appended here as ops and folded into DATA_FILE by compact_data()
+JOURNAL_FILE = 'data/journal.jsonl'
+JOURNAL_COMPACT_OPS = 1000
+# Bumped whenever validate_data() starts fixing up something new
+SCHEMA_VERSION = 2
+
+# In-process copy of the data, refreshed only when the snapshot or journal changes
+_CACHE = {"data": None, "mtime": 0, "journal_offset": 0, "journal_ops": 0,
+          "hash": None, "by_name": None, "aggregates": None, "sales": None,
+          "next_ids": {}, "by_id": {}}
+_LOCK = threading.RLock()
+
+# Serializes writers across gunicorn worker processes; see data_lock()
+LOCK_FILE = 'data/.lock'
+_FILE_LOCK = {"fd": None, "pid": None, "depth": 0}
+
+# Write-behind state: set when the journal has writes that are not yet durable
+FLUSH_INTERVAL = 0.5
+_DIRTY = threading.Event()
+_WRITER = {"pid": None}
+# Journal lines queued by the locked view that is running; None outside views
+_PENDING = {"lines": None}
 
 def load_data():
-    """Load business data from JSON file"""
-    if os.path.exists(DATA_FILE):
+    """Load business data, re-reading the JSON files only when they have changed"""
+    with _LOCK:
+        # Shared flock so a compaction in another worker cannot swap the snapshot
+        # and journal between the stats below and the journal replay
+        with data_lock(shared=True):
+            try:
+                mtime = os.stat(DATA_FILE).st_mtime_ns
+            except FileNotFoundError:
+                mtime = None
+            try:
+                journal_size = os.stat(JOURNAL_FILE).st_size
+            except FileNotFoundError:
+                journal_size = 0
+
+            if _CACHE["data"] is not None and mtime == _CACHE["mtime"]:
+                if journal_size > _CACHE["journal_offset"]:
+                    replay_journal(_CACHE["data"])
+                if journal_size >= _CACHE["journal_offset"]:
+                    return _CACHE["data"]
+
+            stale = False
+            corrupt = False
+            file_hash = None
+            if mtime is None:
+                data = get_default_data()
+            else:
+                try:
+                    with open(DATA_FILE, 'rb') as f:
+                        raw = f.read()
+                    data = json_loads(raw)
+                    file_hash = hash_bytes(raw)
+                    # Files written by save_data() are already valid
+                    if data.get("schema_version") != SCHEMA_VERSION:
+                        data = validate_data(data)
+                        stale = True
+                except JSONDecodeError:
+                    corrupt = True
+
+            if not corrupt:
+                _CACHE["data"] = data
+                _CACHE["mtime"] = mtime
+                _CACHE["hash"] = file_hash
+                _CACHE["journal_offset"] = 0
+                _CACHE["journal_ops"] = 0
+                reset_derived()
+                replay_journal(data)
+
+        if corrupt:
+            # If file is corrupted, keep it aside for recovery and fall back to
+            # default data. Another worker may have moved or replaced it already.
+            with data_lock():
+                try:
+                    if os.stat(DATA_FILE).st_mtime_ns == mtime:
+                        print(f"Data file is corrupted, moving it to {DATA_FILE}.corrupt")
+                        os.replace(DATA_FILE, DATA_FILE + '.corrupt')
+                except FileNotFoundError:
+                    pass
+                return load_data()
+        if stale:
+            # Stamp the file so the next cold load can skip validation. This goes
+            # through compact_data() so the journal is re-read under the file lock
+            # before it is folded in and removed.
+            compact_data()
+            return _CACHE["data"]
+        return data
+
+def replay_journal(data):
+    """Apply journal ops written since the cached offset to data"""
+    try:
+        with open(JOURNAL_FILE, 'rb') as f:
+            f.seek(_CACHE["journal_offset"])
+            chunk = f.read()
+    except FileNotFoundError:
+        return
+
+    # Only consume complete lines; a trailing partial line is picked up next time
+    end = chunk.rfind(b'\n') + 1
+    for line in chunk[:end].splitlines():
+        try:
+            entry = json_loads(line)
+        except JSONDecodeError:
+            # Torn write from a crash mid-append
+            continue
+        apply_op(data, entry)
+        _CACHE["journal_ops"] += 1
+    _CACHE["journal_offset"] += end
+
+def reset_derived():
+    """Drop indexes and totals derived from the data so they are rebuilt on next use"""
+    _CACHE["by_name"] = None
+    _CACHE["aggregates"] = None
+    _CACHE["sales"] = None
+    _CACHE["next_ids"] = {}
+    _CACHE["by_id"] = {}
+
+def records_by_id(data, collection):
+    """Return an id -> record index over data[collection], built once per reload"""
+    with _LOCK:
+        index = _CACHE["by_id"].get(collection)
+        if index is None:
+            # Reversed so the first record with a given id wins, as a scan would
+            index = {r.get('id'): r for r in reversed(data[collection])}
+            _CACHE["by_id"][collection] = index
+        return index
+
+def index_record(collection, record):
+    """Add a new record to its collection's id index if the index has been built"""
+    with _LOCK:
+        index = _CACHE["by_id"].get(collection)
+        if index is not None:
+            index.setdefault(record['id'], record)
+
+def remove_record(data, collection, record_id):
+    """Remove every record with this id, returning the removed records"""
+    with _LOCK:
+        if records_by_id(data, collection).pop(record_id, None) is None:
+            return []
+        # The index rules out misses without a scan. A hit still costs O(N), and
+        # it filters the whole list since a restored file may repeat an id.
+        records = data[collection]
+        removed = [r for r in records if r.get('id') == record_id]
+        records[:] = [r for r in records if r.get('id') != record_id]
+        return removed
+
+def products_by_name(data):
+    """Return a name -> product index over data['products'], built once per change"""
+    with _LOCK:
+        if _CACHE["by_name"] is None:
+            # Reversed so the first product with a given name wins, as a scan would
+            _CACHE["by_name"] = {p.get('name'): p for p in reversed(data['products'])}
+        return _CACHE["by_name"]
+
+def id_number(record_id):
+    """Return an integer id as-is, or None for ids not handed out by next_id()"""
+    return record_id if isinstance(record_id, int) else None
+
+def note_id_number(note_id):
+    """Return the counter behind an 'n0000002a'-style note id, or None for other ids"""
+    if isinstance(note_id, str) and len(note_id) == 9 and note_id[0] == 'n':
+        try:
+            return int(note_id[1:], 16)
+        except ValueError:
+            return None
+    return None
+
+# How to read the counter back out of each collection's ids
+ID_NUMBERS = {"notes": note_id_number}
+
+def next_id(data, collection):
+    """Hand out the next id number for a collection without rescanning it"""
+    with _LOCK:
+        counters = _CACHE["next_ids"]
+        if collection not in counters:
+            number = ID_NUMBERS.get(collection, id_number)
+            numbers = (number(r.get('id')) for r in data[collection])
+            counters[collection] = max((n for n in numbers if n is not None), default=0) + 1
+        record_id = counters[collection]
+        counters[collection] = record_id + 1
+        return record_id
+
+def advance_next_id(collection, record_id):
+    """Keep a collection's id counter past an id handed out by another process"""
+    with _LOCK:
+        counters = _CACHE["next_ids"]
+        if collection in counters:
+            n = ID_NUMBERS.get(collection, id_number)(record_id)
+            if n is not None and n >= counters[collection]:
+                counters[collection] = n + 1
+
+def product_value(product):
+    """Return price * stock for a product, treating missing or bad values as 0"""
+    try:
+        return float(product.get('price') or 0) * float(product.get('stock') or 0)
+    except (TypeError, ValueError):
+        return 0
+
+def get_aggregates(data):
+    """Return running income, expenses and stock value totals, summed once per reload"""
+    with _LOCK:
+        if _CACHE["aggregates"] is None:
+            income = 0
+            expenses = 0
+            for transaction in data['transactions']:
+                if transaction.get('type') == 'sale':
+                    income += transaction.get('amount', 0)
+                elif transaction.get('type') == 'purchase':
+                    expenses += transaction.get('amount', 0)
+            _CACHE["aggregates"] = {
+                "income": income,
+                "expenses": expenses,
+                "stock_value": sum(product_value(p) for p in data['products'])
+            }
+        return _CACHE["aggregates"]
+
+def get_sales_index(data):
+    """Return sale dates, amounts and items as parallel lists sorted by date"""
+    with _LOCK:
+        if _CACHE["sales"] is None:
+            rows = [
+                (t['date'], t.get('amount', 0), t.get('items') or [])
+                for t in data['transactions']
+                if t.get('type') == 'sale' and isinstance(t.get('date'), str)
+            ]
+            rows.sort(key=lambda r: r[0])
+            _CACHE["sales"] = {
+                "dates": [r[0] for r in rows],
+                "amounts": [r[1] for r in rows],
+                "items": [r[2] for r in rows]
+            }
+        return _CACHE["sales"]
+
+def index_sale(transaction):
+    """Add a new sale to the sales index if it has been built"""
+    with _LOCK:
+        sales = _CACHE["sales"]
+        if sales is None:
+            return
+        # New sales are stamped with the current time, so this is nearly always an append
+        i = bisect.bisect_right(sales["dates"], transaction['date'])
+        sales["dates"].insert(i, transaction['date'])
+        sales["amounts"].insert(i, transaction.get('amount', 0))
+        sales["items"].insert(i, transaction.get('items') or [])
+
+def adjust_aggregate(key, delta):
+    """Apply a change to a running total if the totals have been built"""
+    with _LOCK:
+        if _CACHE["aggregates"] is not None:
+            _CACHE["aggregates"][key] += delta
+
+def apply_op(data, entry):
+    """Apply one journal op, keeping indexes and totals in step as the views do"""
+    collection = entry["coll"]
+    index = records_by_id(data, collection)
+    if entry["op"] == "add":
+        record = entry["record"]
+        # Already applied, e.g. replayed again after a crash mid-compaction
+        if record.get('id') in index:
+            return
+        data[collection].append(record)
+        index[record.get('id')] = record
+        advance_next_id(collection, record.get('id'))
+        if collection == 'products':
+            adjust_aggregate('stock_value', product_value(record))
+            if _CACHE["by_name"] is not None:
+                _CACHE["by_name"].setdefault(record.get('name'), record)
+        elif collection == 'transactions':
+            if record.get('type') == 'sale':
+                adjust_aggregate('income', record.get('amount', 0))
+                if isinstance(record.get('date'), str):
+                    index_sale(record)
+            elif record.get('type') == 'purchase':
+                adjust_aggregate('expenses', record.get('amount', 0))
+    elif entry["op"] == "update":
+        record = index.get(entry["id"])
+        if record is None:
+            return
+        fields = entry["record"]
+        old_value = product_value(record)
+        record.update(fields)
+        if 'id' in fields:
+            _CACHE["by_id"].pop(collection, None)
+            advance_next_id(collection, fields['id'])
+        if collection == 'products':
+            adjust_aggregate('stock_value', product_value(record) - old_value)
+            if 'name' in fields or 'id' in fields:
+                _CACHE["by_name"] = None
+        elif collection == 'transactions':
+            # Views never update transactions; rebuild their totals if something did
+            _CACHE["aggregates"] = None
+            _CACHE["sales"] = None
+    elif entry["op"] == "delete":
+        removed = remove_record(data, collection, entry["id"])
+        if not removed:
+            return
+        if collection == 'products':
+            adjust_aggregate('stock_value', -sum(product_value(r) for r in removed))
+            by_name = _CACHE["by_name"]
+            if by_name is not None and any(by_name.get(r.get('name')) is r for r in removed):
+                _CACHE["by_name"] = None
+        elif collection == 'transactions':
+            _CACHE["aggregates"] = None
+            _CACHE["sales"] = None
+
+def append_record(collection, record, op="add", record_id=None):
+    """Append an op for a change already made to the cached data to the journal"""
+    entry = {"op": op, "coll": collection}
+    if record_id is not None:
+        entry["id"] = record_id
+    if record is not None:
+        entry["record"] = record
+
+    line = json_dumps(entry) + b'\n'
+    with data_lock():
+        if _PENDING["lines"] is not None:
+            # Inside a locked view: written once the whole view has succeeded
+            _PENDING["lines"].append(line)
+        else:
+            write_journal([line])
+
+def write_journal(lines):
+    """Append serialized ops to the journal in a single write"""
+    if not lines:
+        return
+    with data_lock():
+        os.makedirs(os.path.dirname(JOURNAL_FILE), exist_ok=True)
+        with open(JOURNAL_FILE, 'ab') as f:
+            f.write(b''.join(lines))
+            _CACHE["journal_offset"] = f.tell()
+        _CACHE["journal_ops"] += len(lines)
+
+    # fsync and compaction happen on the background writer
+    start_writer()
+    _DIRTY.set()
+
+def compact_data():
+    """Fold the journal into a fresh snapshot of the data file"""
+    with data_lock():
+        save_data(load_data())
+
+def flush_data():
+    """Make journalled writes durable, compacting the journal once it is long"""
+    with data_lock():
+        if _CACHE["journal_ops"] >= JOURNAL_COMPACT_OPS:
+            compact_data()
+            return
+    try:
+        # 'r+b' rather than 'ab' so a compacted-away journal is not recreated empty
+        with open(JOURNAL_FILE, 'r+b') as f:
+            os.fsync(f.fileno())
+    except FileNotFoundError:
+        pass
+
+def start_writer():
+    """Start the background writer thread once per process"""
+    with _LOCK:
+        if _WRITER["pid"] != os.getpid():
+            _WRITER["pid"] = os.getpid()
+            threading.Thread(target=writer_loop, daemon=True).start()
+
+def writer_loop():
+    """Flush the journal whenever writes are pending"""
+    while True:
+        _DIRTY.wait()
+        # Let a burst of writes pile up so they share one flush
+        time.sleep(FLUSH_INTERVAL)
+        _DIRTY.clear()
         try:
-            with open(DATA_FILE, 'r') as f:
-                data = json.load(f)
-                # Ensure all required fields exist and are valid
-                data = validate_data(data)
-                return data
-        except json.JSONDecodeError:
-            # If file is corrupted, return default data
-            return get_default_data()
-    else:
-        return get_default_data()
+            flush_data()
+        except Exception as e:
+            print(f"Error flushing data: {e}")
 
 def get_default_data():
     """Return default data structure"""
@@ -125,11 +540,112 @@ def validate_data(data):
     
     return data
 
+def hash_bytes(buf):
+    """Return a short digest used to tell whether the data file content changed"""
+    return hashlib.blake2b(buf, digest_size=16).digest()
+
 def save_data(data):
-    """Save business data to JSON file"""
-    os.makedirs('data', exist_ok=True)
-    with open(DATA_FILE, 'w') as f:
-        json.dump(data, f, indent=2)
+    """Save business data to JSON file and refresh the in-process cache"""
+    with data_lock():
+        data["schema_version"] = SCHEMA_VERSION
+        buf = json_dumps(data)
+        buf_hash = hash_bytes(buf)
+        try:
+            disk_mtime = os.stat(DATA_FILE).st_mtime_ns
+        except FileNotFoundError:
+            disk_mtime = None
+        # Skip the write only when the file is still the one this process last read
+        # or wrote and it already holds exactly these bytes. A pending journal always
+        # forces a write, since the new mtime is what tells other worker processes
+        # that the journal they were reading is gone.
+        if (buf_hash != _CACHE["hash"] or disk_mtime is None
+                or disk_mtime != _CACHE["mtime"] or os.path.exists(JOURNAL_FILE)):
+            os.makedirs(os.path.dirname(DATA_FILE), exist_ok=True)
+            # Write to a temp file and rename so a crash never leaves a partial file
+            tmp_file = DATA_FILE + '.tmp'
+            with open(tmp_file, 'wb') as f:
+                f.write(buf)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, DATA_FILE)
+            _CACHE["hash"] = buf_hash
+        # The snapshot now holds everything the journal did
+        try:
+            os.remove(JOURNAL_FILE)
+        except FileNotFoundError:
+            pass
+        _CACHE["data"] = data
+        _CACHE["mtime"] = os.stat(DATA_FILE).st_mtime_ns
+        _CACHE["journal_offset"] = 0
+        _CACHE["journal_ops"] = 0
+        reset_derived()
+
+@contextlib.contextmanager
+def data_lock(shared=False):
+    """Hold the in-process lock plus, across worker processes, an flock on LOCK_FILE"""
+    # A shared lock only keeps writers out. Nested calls reuse whatever lock the
+    # outermost one took, so never ask for an exclusive lock inside a shared one.
+    with _LOCK:
+        if fcntl is None:
+            yield
+            return
+        if _FILE_LOCK["pid"] != os.getpid():
+            # A forked worker must not share its parent's lock file description
+            os.makedirs(os.path.dirname(LOCK_FILE), exist_ok=True)
+            _FILE_LOCK["fd"] = os.open(LOCK_FILE, os.O_RDWR | os.O_CREAT)
+            _FILE_LOCK["pid"] = os.getpid()
+            _FILE_LOCK["depth"] = 0
+        if _FILE_LOCK["depth"] == 0:
+            fcntl.flock(_FILE_LOCK["fd"], fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        _FILE_LOCK["depth"] += 1
+        try:
+            yield
+        finally:
+            _FILE_LOCK["depth"] -= 1
+            if _FILE_LOCK["depth"] == 0:
+                fcntl.flock(_FILE_LOCK["fd"], fcntl.LOCK_UN)
+
+def locked(view):
+    """Run a view under the data lock so its load/modify/save is not interleaved"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        with data_lock():
+            _PENDING["lines"] = []
+            try:
+                result = view(*args, **kwargs)
+            except Exception:
+                # The view may have half-changed the cached data; re-read it from disk
+                _CACHE["data"] = None
+                raise
+            finally:
+                lines, _PENDING["lines"] = _PENDING["lines"], None
+            write_journal(lines)
+            return result
+    return wrapper
+
+def data_etag():
+    """Return a tag for the current data version, the same in every worker process"""
+    with _LOCK:
+        return f'{_CACHE["mtime"] or 0:x}-{_CACHE["journal_offset"]:x}'
+
+def client_has_etag(etag):
+    """Check If-None-Match, ignoring the ':gzip'/':br' suffix Flask-Compress adds to tags"""
+    if_none_match = request.if_none_match
+    return if_none_match.star_tag or any(
+        tag.split(':', 1)[0] == etag for tag in if_none_match.as_set(include_weak=True)
+    )
+
+def conditional_json(data, key):
+    """Return data[key] as JSON, or an empty 304 if the client already has this version"""
+    with _LOCK:
+        etag = data_etag()
+        if client_has_etag(etag):
+            response = app.response_class(status=304)
+        else:
+            response = jsonify(data[key])
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, max-age=0, must-revalidate'
+    return response
 
 @app.route('/')
 def index():
@@ -139,9 +655,10 @@ def index():
 @app.route('/api/products', methods=['GET'])
 def get_products():
     data = load_data()
-    return jsonify(data['products'])
+    return conditional_json(data, 'products')
 
 @app.route('/api/products', methods=['POST'])
+@locked
 def add_product():
     data = load_data()
     product = request.json
@@ -165,38 +682,63 @@ def add_product():
         product["stock"] = 0
         product["cost"] = 0
     
-    product['id'] = max([p['id'] for p in data['products']], default=0) + 1
+    product['id'] = next_id(data, 'products')
     product['last_updated'] = datetime.now().isoformat()
     data['products'].append(product)
-    save_data(data)
+    index_record('products', product)
+    _CACHE["by_name"] = None
+    adjust_aggregate('stock_value', product_value(product))
+    append_record('products', product)
     return jsonify(product), 201
 
 @app.route('/api/products/<int:product_id>', methods=['PUT'])
+@locked
 def update_product(product_id):
     data = load_data()
-    for i, product in enumerate(data['products']):
-        if product['id'] == product_id:
-            updates = request.json
-            updates['last_updated'] = datetime.now().isoformat()
-            data['products'][i].update(updates)
-            save_data(data)
-            return jsonify(data['products'][i])
-    return jsonify({"error": "Product not found"}), 404
+    product = records_by_id(data, 'products').get(product_id)
+    if product is None:
+        return jsonify({"error": "Product not found"}), 404
+    
+    updates = request.json
+    
+    # Ensure numeric values; save_data() stamps the file, so they are not revalidated
+    for key, convert in (("price", float), ("stock", lambda v: int(float(v))), ("cost", float)):
+        if key in updates:
+            try:
+                updates[key] = convert(updates[key])
+            except (ValueError, TypeError):
+                updates[key] = 0
+    
+    updates['last_updated'] = datetime.now().isoformat()
+    old_value = product_value(product)
+    product.update(updates)
+    if 'id' in updates:
+        _CACHE["by_id"].pop('products', None)
+        advance_next_id('products', updates['id'])
+    _CACHE["by_name"] = None
+    adjust_aggregate('stock_value', product_value(product) - old_value)
+    append_record('products', updates, op="update", record_id=product_id)
+    return jsonify(product)
 
 @app.route('/api/products/<int:product_id>', methods=['DELETE'])
+@locked
 def delete_product(product_id):
     data = load_data()
-    data['products'] = [p for p in data['products'] if p['id'] != product_id]
-    save_data(data)
+    removed = remove_record(data, 'products', product_id)
+    if removed:
+        adjust_aggregate('stock_value', -sum(product_value(p) for p in removed))
+        _CACHE["by_name"] = None
+        append_record('products', None, op="delete", record_id=product_id)
     return jsonify({"message": "Product deleted"}), 200
 
 # TRANSACTIONS API
 @app.route('/api/transactions', methods=['GET'])
 def get_transactions():
     data = load_data()
-    return jsonify(data['transactions'])
+    return conditional_json(data, 'transactions')
 
 @app.route('/api/transactions', methods=['POST'])
+@locked
 def add_transaction():
     data = load_data()
     transaction = request.json
@@ -213,20 +755,28 @@ def add_transaction():
     except (ValueError, TypeError):
         transaction["amount"] = 0
     
-    transaction['id'] = max([t['id'] for t in data['transactions']], default=0) + 1
+    transaction['id'] = next_id(data, 'transactions')
     transaction['date'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     
     # Update stock for sales
     if transaction['type'] == 'sale' and 'items' in transaction:
+        by_name = products_by_name(data)
         for item in transaction['items']:
-            for product in data['products']:
-                if product['name'] == item['name']:
-                    quantity = item.get('quantity', 1)
-                    product['stock'] = max(0, product['stock'] - quantity)
-                    break
+            product = by_name.get(item['name'])
+            if product is not None:
+                quantity = item.get('quantity', 1)
+                old_value = product_value(product)
+                product['stock'] = max(0, product['stock'] - quantity)
+                adjust_aggregate('stock_value', product_value(product) - old_value)
+                append_record('products', {'stock': product['stock']}, op="update", record_id=product['id'])
     
+    if transaction['type'] == 'sale':
+        adjust_aggregate('income', transaction['amount'])
+        index_sale(transaction)
+    elif transaction['type'] == 'purchase':
+        adjust_aggregate('expenses', transaction['amount'])
     data['transactions'].append(transaction)
-    save_data(data)
+    append_record('transactions', transaction)
     return jsonify(transaction), 201
 
 # ANALYTICS API
@@ -237,43 +787,51 @@ def get_sales_analytics():
     
     end_date = datetime.now()
     start_date = end_date - timedelta(days=days)
+    # Transaction dates are fixed-width '%Y-%m-%d %H:%M:%S' strings, so they
+    # compare correctly as text and their first 10 characters are the day
+    start_str = start_date.strftime('%Y-%m-%d %H:%M:%S')
+    end_str = end_date.strftime('%Y-%m-%d %H:%M:%S')
     
-    daily_sales = {}
+    # One bucket per day in the window, so the fill-in pass is not needed
+    daily_sales = {
+        (start_date + timedelta(days=i)).strftime('%Y-%m-%d'): 0
+        for i in range(days + 1)
+    }
     product_sales = defaultdict(float)
     
-    for transaction in data['transactions']:
-        if transaction['type'] == 'sale':
-            try:
-                trans_date = datetime.strptime(transaction['date'], '%Y-%m-%d %H:%M:%S')
-                if start_date <= trans_date <= end_date:
-                    date_str = trans_date.strftime('%Y-%m-%d')
-                    daily_sales[date_str] = daily_sales.get(date_str, 0) + transaction.get('amount', 0)
-                    
-                    if 'items' in transaction:
-                        for item in transaction['items']:
-                            quantity = item.get('quantity', 1)
-                            price = item.get('price', 0)
-                            product_sales[item.get('name', 'Unknown')] += quantity * price
-            except Exception as e:
-                print(f"Error processing transaction: {e}")
-                continue
-    
-    # Fill missing days
-    dates = []
-    sales = []
-    current_date = start_date
-    while current_date <= end_date:
-        date_str = current_date.strftime('%Y-%m-%d')
-        dates.append(date_str)
-        sales.append(daily_sales.get(date_str, 0))
-        current_date += timedelta(days=1)
+    # Sales are kept sorted by date, so only the rows inside the window are visited.
+    # Slice them under the lock so a concurrent index_sale() cannot shift one list
+    # before the others.
+    with _LOCK:
+        sales_index = get_sales_index(data)
+        lo = bisect.bisect_left(sales_index["dates"], start_str)
+        hi = bisect.bisect_right(sales_index["dates"], end_str)
+        rows = zip(
+            sales_index["dates"][lo:hi],
+            sales_index["amounts"][lo:hi],
+            sales_index["items"][lo:hi]
+        )
+    
+    for sale_date, amount, items in rows:
+        try:
+            daily_sales[sale_date[:10]] += amount
+            
+            for item in items:
+                product_sales[item.get('name', 'Unknown')] += item.get('quantity', 1) * item.get('price', 0)
+        except Exception as e:
+            print(f"Error processing transaction: {e}")
+            continue
+    
+    dates = list(daily_sales)
+    sales = list(daily_sales.values())
+    total_sales = sum(sales)
     
     return jsonify({
         'dates': dates,
         'sales': sales,
-        'top_products': sorted(product_sales.items(), key=lambda x: x[1], reverse=True)[:10],
-        'total_sales': sum(sales),
-        'avg_daily_sales': sum(sales) / len(sales) if sales else 0
+        'top_products': heapq.nlargest(10, product_sales.items(), key=lambda x: x[1]),
+        'total_sales': total_sales,
+        'avg_daily_sales': total_sales / len(sales) if sales else 0
     })
 
 @app.route('/api/analytics/balance')
@@ -281,28 +839,10 @@ def get_balance():
     data = load_data()
     
     try:
-        # Calculate income from sales
-        income = 0
-        for transaction in data['transactions']:
-            if transaction.get('type') == 'sale':
-                income += transaction.get('amount', 0)
-        
-        # Calculate expenses from purchases
-        expenses = 0
-        for transaction in data['transactions']:
-            if transaction.get('type') == 'purchase':
-                expenses += transaction.get('amount', 0)
-        
-        # Calculate stock value safely
-        stock_value = 0
-        for product in data['products']:
-            price = product.get('price', 0)
-            stock = product.get('stock', 0)
-            if price is None:
-                price = 0
-            if stock is None:
-                stock = 0
-            stock_value += price * stock
+        aggregates = get_aggregates(data)
+        income = aggregates['income']
+        expenses = aggregates['expenses']
+        stock_value = aggregates['stock_value']
         
         gross_profit = income - expenses
         
@@ -329,9 +869,10 @@ def get_balance():
 @app.route('/api/notes', methods=['GET'])
 def get_notes():
     data = load_data()
-    return jsonify(data['notes'])
+    return conditional_json(data, 'notes')
 
 @app.route('/api/notes', methods=['POST'])
+@locked
 def add_note():
     data = load_data()
     note = request.json
@@ -339,108 +880,121 @@ def add_note():
     if not note.get('title'):
         return jsonify({"error": "Note title is required"}), 400
     
-    note['id'] = str(uuid.uuid4())
+    note['id'] = f"n{next_id(data, 'notes'):08x}"
     note['created_at'] = datetime.now().isoformat()
     note['updated_at'] = note['created_at']
     note.setdefault('content', '')
     note.setdefault('category', 'General')
     
     data['notes'].append(note)
-    save_data(data)
+    index_record('notes', note)
+    append_record('notes', note)
     return jsonify(note), 201
 
 @app.route('/api/notes/<note_id>', methods=['PUT'])
+@locked
 def update_note(note_id):
     data = load_data()
-    for i, note in enumerate(data['notes']):
-        if note['id'] == note_id:
-            updates = request.json
-            updates['updated_at'] = datetime.now().isoformat()
-            data['notes'][i].update(updates)
-            save_data(data)
-            return jsonify(data['notes'][i])
-    return jsonify({"error": "Note not found"}), 404
+    note = records_by_id(data, 'notes').get(note_id)
+    if note is None:
+        return jsonify({"error": "Note not found"}), 404
+    
+    updates = request.json
+    updates['updated_at'] = datetime.now().isoformat()
+    note.update(updates)
+    if 'id' in updates:
+        _CACHE["by_id"].pop('notes', None)
+        advance_next_id('notes', updates['id'])
+    append_record('notes', updates, op="update", record_id=note_id)
+    return jsonify(note)
 
 @app.route('/api/notes/<note_id>', methods=['DELETE'])
+@locked
 def delete_note(note_id):
     data = load_data()
-    data['notes'] = [n for n in data['notes'] if n['id'] != note_id]
-    save_data(data)
+    if remove_record(data, 'notes', note_id):
+        append_record('notes', None, op="delete", record_id=note_id)
     return jsonify({"message": "Note deleted"}), 200
 
 # EXPORT API
+CSV_BATCH_ROWS = 500
+
+def csv_row_getter(fieldnames, defaults):
+    """Return a function mapping a record to a tuple of its values for fieldnames"""
+    get = operator.itemgetter(*fieldnames)
+    
+    def row(record):
+        try:
+            return get(record)
+        except KeyError:
+            return tuple(record.get(f, defaults.get(f, '')) for f in fieldnames)
+    return row
+
+def stream_csv(fieldnames, rows):
+    """Yield CSV text a batch of rows at a time instead of building the whole file in memory"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fieldnames)
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, CSV_BATCH_ROWS))
+        writer.writerows(batch)
+        yield buffer.getvalue()
+        if len(batch) < CSV_BATCH_ROWS:
+            return
+        buffer.seek(0)
+        buffer.truncate()
+
+def csv_response(chunks, filename):
+    """Stream CSV chunks as a file download"""
+    return Response(
+        stream_with_context(chunks),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
 @app.route('/api/export/csv/<export_type>')
 def export_csv(export_type):
     data = load_data()
     
     if export_type == 'products':
-        output = io.StringIO()
-        writer = csv.DictWriter(output, fieldnames=['id', 'name', 'category', 'price', 'stock', 'cost', 'supplier'])
-        writer.writeheader()
-        for product in data['products']:
-            row = {
-                'id': product.get('id', ''),
-                'name': product.get('name', ''),
-                'category': product.get('category', ''),
-                'price': product.get('price', 0),
-                'stock': product.get('stock', 0),
-                'cost': product.get('cost', 0),
-                'supplier': product.get('supplier', '')
-            }
-            writer.writerow(row)
-        output.seek(0)
-        
-        return send_file(
-            io.BytesIO(output.getvalue().encode()),
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name='products_export.csv'
-        )
+        fieldnames = ('id', 'name', 'category', 'price', 'stock', 'cost', 'supplier')
+        row = csv_row_getter(fieldnames, {'price': 0, 'stock': 0, 'cost': 0})
+        return csv_response(stream_csv(fieldnames, map(row, data['products'])), 'products_export.csv')
     
     elif export_type == 'transactions':
-        output = io.StringIO()
-        writer = csv.DictWriter(output, fieldnames=['id', 'date', 'type', 'amount', 'customer', 'supplier', 'description'])
-        writer.writeheader()
-        for transaction in data['transactions']:
-            row = {
-                'id': transaction.get('id', ''),
-                'date': transaction.get('date', ''),
-                'type': transaction.get('type', ''),
-                'amount': transaction.get('amount', 0),
-                'customer': transaction.get('customer', ''),
-                'supplier': transaction.get('supplier', ''),
-                'description': transaction.get('description', '')
-            }
-            writer.writerow(row)
-        output.seek(0)
-        
-        return send_file(
-            io.BytesIO(output.getvalue().encode()),
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name='transactions_export.csv'
-        )
+        fieldnames = ('id', 'date', 'type', 'amount', 'customer', 'supplier', 'description')
+        row = csv_row_getter(fieldnames, {'amount': 0})
+        return csv_response(stream_csv(fieldnames, map(row, data['transactions'])), 'transactions_export.csv')
     
     return jsonify({"error": "Invalid export type"}), 400
 
 # BACKUP API
 @app.route('/api/backup')
 def backup_data():
-    data = load_data()
-    
-    # Create a clean copy for backup
-    backup_data = validate_data(data.copy())
+    download_name = f'business_backup_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json'
     
-    backup_bytes = json.dumps(backup_data, indent=2).encode('utf-8')
+    # The data file is kept compact; indent the download only on request
+    if request.args.get('pretty', '').lower() in ('1', 'true', 'yes'):
+        return send_file(
+            io.BytesIO(json_dumps(load_data(), pretty=True)),
+            mimetype='application/json',
+            as_attachment=True,
+            download_name=download_name
+        )
     
+    # Fold any journal in so the data file is current, then send it as-is
+    if os.path.exists(JOURNAL_FILE) or not os.path.exists(DATA_FILE):
+        compact_data()
     return send_file(
-        io.BytesIO(backup_bytes),
+        os.path.abspath(DATA_FILE),
         mimetype='application/json',
         as_attachment=True,
-        download_name=f'business_backup_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json'
+        download_name=download_name
     )
 
 @app.route('/api/restore', methods=['POST'])
+@locked
 def restore_data():
     if 'file' not in request.files:
         return jsonify({"error": "No file provided"}), 400
@@ -451,12 +1005,12 @@ def restore_data():
     
     if file and file.filename.endswith('.json'):
         try:
-            data = json.load(file)
+            data = json_loads(file.read())
             # Validate the data before saving
             validated_data = validate_data(data)
             save_data(validated_data)
             return jsonify({"message": "Data restored successfully"}), 200
-        except json.JSONDecodeError:
+        except JSONDecodeError:
             return jsonify({"error": "Invalid JSON file"}), 400
         except Exception as e:
             return jsonify({"error": f"Error restoring data: {str(e)}"}), 400
@@ -468,9 +1022,15 @@ def restore_data():
 def health_check():
     return jsonify({"status": "healthy", "timestamp": datetime.now().isoformat()})
 
-# Initialize data directory
+# Warm the cache at import so the first request does not pay for the load
+load_data()
+# Flush pending writes on a clean shutdown (gunicorn handles SIGTERM by exiting)
+atexit.register(flush_data)
+
+# Local development only; in production run under gunicorn (see Procfile):
+#   gunicorn -w 4 -k gthread --threads 4 --keep-alive 5 --preload app:app
 if __name__ == '__main__':
     os.makedirs('data', exist_ok=True)
-    # Load data once to ensure file exists
-    load_data()
+    # Fold any journal left from the last run into the data file
+    compact_data()
     app.run(debug=True, port=5000)
@@ -0,0 +1,83 @@
+import multiprocessing
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+
+
+WRITERS = 3
+READERS = 3
+SALES_PER_WRITER = 40
+
+
+def write_sales(count):
+    """Post sales from a separate worker process, compacting as often as possible"""
+    client = app.app.test_client()
+    for _ in range(count):
+        response = client.post('/api/transactions', json={"type": "sale", "amount": 1})
+        assert response.status_code == 201
+        app.flush_data()
+
+
+def read_until_done(done, results):
+    """Keep reloading in a separate worker process, counting views with missing writes"""
+    torn = 0
+    while not done.is_set():
+        data = app.load_data()
+        # Ids are handed out in commit order, so a consistent view has no gaps
+        ids = sorted(t['id'] for t in data['transactions'])
+        if ids != list(range(1, len(ids) + 1)):
+            torn += 1
+    data = app.load_data()
+    results.put((torn, len(data['transactions']), app.get_aggregates(data)['income']))
+
+
+class LoadDataAcrossProcessesTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.saved = (app.DATA_FILE, app.JOURNAL_FILE, app.LOCK_FILE, app.JOURNAL_COMPACT_OPS)
+        app.DATA_FILE = os.path.join(self.tmp.name, 'business_data.json')
+        app.JOURNAL_FILE = os.path.join(self.tmp.name, 'journal.jsonl')
+        app.LOCK_FILE = os.path.join(self.tmp.name, '.lock')
+        # Compact every few ops so readers keep seeing snapshots swapped under them
+        app.JOURNAL_COMPACT_OPS = 3
+        app.save_data(app.get_default_data())
+
+    def tearDown(self):
+        app.DATA_FILE, app.JOURNAL_FILE, app.LOCK_FILE, app.JOURNAL_COMPACT_OPS = self.saved
+        app._CACHE["data"] = None
+        self.tmp.cleanup()
+
+    @unittest.skipIf(app.fcntl is None, "needs fcntl for the cross-process lock")
+    def test_readers_do_not_lose_writes_during_compaction(self):
+        ctx = multiprocessing.get_context('fork')
+        done = ctx.Event()
+        results = ctx.Queue()
+        readers = [ctx.Process(target=read_until_done, args=(done, results)) for _ in range(READERS)]
+        writers = [ctx.Process(target=write_sales, args=(SALES_PER_WRITER,)) for _ in range(WRITERS)]
+        for process in readers + writers:
+            process.start()
+        for process in writers:
+            process.join()
+            self.assertEqual(process.exitcode, 0)
+        done.set()
+        seen = [results.get(timeout=30) for _ in readers]
+        for process in readers:
+            process.join()
+
+        app._CACHE["data"] = None
+        data = app.load_data()
+        expected = len(app.get_default_data()['transactions']) + WRITERS * SALES_PER_WRITER
+        self.assertEqual(len(data['transactions']), expected)
+        for torn, count, income in seen:
+            self.assertEqual(torn, 0)
+            self.assertEqual(count, expected)
+            self.assertEqual(income, app.get_aggregates(data)['income'])
+
+
+if __name__ == '__main__':
+    unittest.main()